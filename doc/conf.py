@@ -42,7 +42,7 @@ release = __version__
 
 html_theme = 'sphinx_rtd_theme'
 
-autodoc_mock_imports = ['Corrfunc', 'mpi4py', 'pmesh']
+autodoc_mock_imports = ['Corrfunc', 'mpi4py', 'pmesh', 'numba', 'cupy']
 
 # Add any paths that contain templates here, relative to this directory.
 templates_path = ['_templates']
@@ -193,10 +193,9 @@ def TwoPointCorrelationFunction(mode, edges, data_positions1, data_positions2=No
         Then setting ``compute_sepsavg`` is virtually costless.
         For non-linear binning, set to "custom".
         "auto" allows for auto-detection of the binning type:
-        linear binning will be chosen if input edges are
-        within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
-        (absolute tolerance) of the array
-        ``np.linspace(edges[0], edges[-1], len(edges))``.
+        linear binning will be chosen if all bin widths ``np.diff(edges)``
+        are within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
+        (absolute tolerance) of the first one.
 
     position_type : string, default='auto'
         Type of input positions, one of:
@@ -249,7 +248,7 @@ def TwoPointCorrelationFunction(mode, edges, data_positions1, data_positions2=No
 
     dtype : string, np.dtype, default='f8'
         Array type for positions and weights.
-        If ``None``, defaults to type of first array of positions.
+        If ``None``, defaults to the common type of the first positions arrays (e.g. float64 if float32 and float64 arrays are mixed).
         Double precision is highly recommended in case ``mode`` is "theta",
         ``twopoint_weights`` is provided (due to cosine), or ``compute_sepsavg`` is ``True``.
         dtype='f8' highly recommended for ``mode = 'theta'`` or for :math:`\theta`-cut.
@@ -0,0 +1,181 @@
+"""Implement CuPy two-point counter engine, to count pairs on GPU."""
+
+import functools
+
+import numpy as np
+
+try:
+    import cupy
+except ImportError:
+    cupy = None
+
+from .twopoint_counter import TwoPointCounterError
+from .numba_engine import NumbaTwoPointCounter
+
+
+# Brute-force pair counting, mode "s".
+# Each thread handles one particle of the first catalog; tiles of blockDim.x particles of the second catalog are loaded in shared memory.
+# Counts are accumulated in a block-local histogram in shared memory, then added to the global histogram.
+# Positions are (3, N) (SoA) arrays, of type real_t.
+_pair_count_s_source = r'''
+extern "C" __global__
+void pair_count_s(const real_t* P1, const double* W1, const int N1, const real_t* P2, const double* W2, const int N2,
+                  const real_t* edges, const int nbins, const real_t inv_dx, const real_t lo, const int lin,
+                  const real_t* boxsize, const int weighted,
+                  unsigned long long* ncounts, double* wcounts, double* sepsum)
+{
+    extern __shared__ double shared[];
+    double* tile_w = shared;
+    unsigned long long* block_ncounts = (unsigned long long*) (tile_w + blockDim.x);
+    double* block_wcounts = (double*) (block_ncounts + nbins);
+    double* block_sepsum = block_wcounts + nbins;
+    real_t* tile_x = (real_t*) (block_sepsum + nbins);
+    real_t* tile_y = tile_x + blockDim.x;
+    real_t* tile_z = tile_y + blockDim.x;
+
+    const int tid = threadIdx.x;
+    for (int ib = tid; ib < nbins; ib += blockDim.x) {
+        block_ncounts[ib] = 0ULL;
+        block_wcounts[ib] = 0.;
+        block_sepsum[ib] = 0.;
+    }
+    const int i = blockIdx.x * blockDim.x + tid;
+    real_t x1 = 0, y1 = 0, z1 = 0;
+    double w1 = 1.;
+    if (i < N1) {
+        x1 = P1[i]; y1 = P1[N1 + i]; z1 = P1[2 * N1 + i];
+        if (weighted) w1 = W1[i];
+    }
+    const int periodic = boxsize[0] > 0;
+    const real_t smin = edges[0], smax = edges[nbins];
+    // fl(sqrt(r2)) >= smax if r2 > fl(smax * smax): pairs are rejected before the square root;
+    // similarly with smin, with a margin for rounding errors
+    const real_t smax2 = smax * smax, smin2 = smin > 0 ? (real_t) (1. - 1e-5) * smin * smin : 0;
+    __syncthreads();
+
+    for (int j0 = 0; j0 < N2; j0 += blockDim.x) {
+        const int j = j0 + tid;
+        if (j < N2) {
+            tile_x[tid] = P2[j]; tile_y[tid] = P2[N2 + j]; tile_z[tid] = P2[2 * N2 + j];
+            tile_w[tid] = weighted ? W2[j] : 1.;
+        }
+        __syncthreads();
+        if (i < N1) {
+            const int ntile = min((int) blockDim.x, N2 - j0);
+            for (int jj = 0; jj < ntile; jj++) {
+                real_t dx = tile_x[jj] - x1, dy = tile_y[jj] - y1, dz = tile_z[jj] - z1;
+                if (periodic) {
+                    if (dx > boxsize[0] / 2) dx -= boxsize[0]; else if (dx < -boxsize[0] / 2) dx += boxsize[0];
+                    if (dy > boxsize[1] / 2) dy -= boxsize[1]; else if (dy < -boxsize[1] / 2) dy += boxsize[1];
+                    if (dz > boxsize[2] / 2) dz -= boxsize[2]; else if (dz < -boxsize[2] / 2) dz += boxsize[2];
+                }
+                const real_t r2 = dx * dx + dy * dy + dz * dz;
+                if (r2 > smax2 || r2 < smin2) continue;
+                const real_t s = sqrt(r2);
+                if (s < smin || s >= smax) continue;
+                int ib;
+                if (lin) {
+                    ib = min(max((int) ((s - lo) * inv_dx), 0), nbins - 1);
+                }
+                else {
+                    // binary search, such that edges[ib] <= s < edges[ib + 1]
+                    int ilo = 0, ihi = nbins;
+                    while (ihi - ilo > 1) {
+                        const int imid = (ilo + ihi) / 2;
+                        if (edges[imid] <= s) ilo = imid;
+                        else ihi = imid;
+                    }
+                    ib = ilo;
+                }
+                const double weight = w1 * tile_w[jj];
+                atomicAdd(&block_ncounts[ib], 1ULL);
+                atomicAdd(&block_wcounts[ib], weight);
+                atomicAdd(&block_sepsum[ib], weight * s);
+            }
+        }
+        __syncthreads();
+    }
+
+    for (int ib = tid; ib < nbins; ib += blockDim.x) {
+        if (block_ncounts[ib]) {
+            atomicAdd(&ncounts[ib], block_ncounts[ib]);
+            atomicAdd(&wcounts[ib], block_wcounts[ib]);
+            atomicAdd(&sepsum[ib], block_sepsum[ib]);
+        }
+    }
+}
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pair_count_s(dtype):
+    # Return pair-counting kernel for mode "s", compiled for positions of type dtype
+    real_t = {4: 'float', 8: 'double'}[np.dtype(dtype).itemsize]
+    return cupy.RawKernel(_pair_count_s_source, 'pair_count_s', options=('-Dreal_t={}'.format(real_t),))
+
+
+class CupyTwoPointCounter(NumbaTwoPointCounter):
+
+    """
+    Extend :class:`NumbaTwoPointCounter` for two-point counting on GPU with CuPy.
+    Only mode "s" is computed on GPU; other modes, or all modes if CuPy is not installed,
+    fall back to :class:`NumbaTwoPointCounter` on CPU.
+    """
+    name = 'cupy'
+
+    def run(self):
+        """Compute the two-point counts and set :attr:`wcounts` and :attr:`sep`."""
+        attrs = dict(self.attrs)
+        threads_per_block = int(attrs.pop('threads_per_block', 256))
+        if threads_per_block < 1 or threads_per_block % 32:
+            raise TwoPointCounterError('threads_per_block must be a positive multiple of 32, found {:d}'.format(threads_per_block))
+        # tile of positions and weights of the second catalog, and block-local histograms
+        shared_mem = threads_per_block * (8 + 3 * np.dtype(self.dtype).itemsize) + self.shape[0] * 3 * 8
+        fallback = None
+        if cupy is None:
+            fallback = 'cupy is not installed'
+        elif self.n_bitwise_weights:
+            fallback = 'bitwise weights are not implemented on GPU'
+        elif self.mode != 's':
+            fallback = 'mode {} is not implemented on GPU'.format(self.mode)
+        elif shared_mem > 48 * 1024:
+            fallback = 'too many bins ({:d}) for the GPU shared memory'.format(self.shape[0])
+        if fallback is not None:
+            if not self.with_mpi or self.mpicomm.rank == 0:
+                self.log_info('{}, falling back to numba engine on CPU.'.format(fallback))
+            self._run(attrs)
+            return
+        self._check_supported()
+        if attrs:
+            import warnings
+            warnings.warn('These arguments are not read: {}'.format(attrs))
+
+        dpositions1, dweights1, dpositions2, dweights2 = self._get_positions_weights()
+        nbins = self.shape[0]
+        ncounts, wcounts, sepsum = np.zeros(nbins, dtype='i8'), np.zeros(nbins, dtype='f8'), np.zeros(nbins, dtype='f8')
+        if dpositions1.shape[0] and dpositions2.shape[0]:
+            ftype = np.dtype(self.dtype).type
+
+            def get_positions(positions):
+                # (3, N) arrays on device, such that loads of each coordinate by consecutive threads are coalesced
+                return cupy.asarray(np.ascontiguousarray(positions.T))
+
+            def get_weights(weights):
+                # individual weights only, bitwise weights are not supported on GPU
+                return cupy.asarray(weights[0]) if weights[0].size else cupy.empty(0, dtype='f8')
+
+            positions1, weights1 = get_positions(dpositions1), get_weights(dweights1)
+            if dpositions2 is dpositions1: positions2, weights2 = positions1, weights1
+            else: positions2, weights2 = get_positions(dpositions2), get_weights(dweights2)
+            edges = self.edges[0].astype(ftype)
+            boxsize = self.boxsize if self.periodic else np.zeros(3)
+            d_ncounts, d_wcounts, d_sepsum = cupy.zeros(nbins, dtype='u8'), cupy.zeros(nbins, dtype='f8'), cupy.zeros(nbins, dtype='f8')
+            size1, size2 = dpositions1.shape[0], dpositions2.shape[0]
+            _get_pair_count_s(self.dtype)(((size1 + threads_per_block - 1) // threads_per_block,), (threads_per_block,),
+                                          (positions1, weights1, np.int32(size1), positions2, weights2, np.int32(size2),
+                                           cupy.asarray(edges), np.int32(nbins), ftype(nbins / (edges[-1] - edges[0])), ftype(edges[0]), np.int32(self.bin_type == 'lin'),
+                                           cupy.asarray(boxsize.astype(ftype)), np.int32(dweights1[0].size > 0), d_ncounts, d_wcounts, d_sepsum),
+                                          shared_mem=shared_mem)
+            ncounts, wcounts, sepsum = d_ncounts.get().astype('i8'), d_wcounts.get(), d_sepsum.get()
+
+        self._set_counts(ncounts, wcounts, sepsum)
@@ -0,0 +1,585 @@
+"""Implement Numba two-point counter engine."""
+
+import math
+import functools
+
+import numpy as np
+import numba
+from numba import njit, prange, types
+from numba.extending import intrinsic
+
+from .twopoint_counter import BaseTwoPointCounter, TwoPointCounterError, _is_linear
+from . import utils
+
+
+# No 'nnan' / 'ninf': edges may be infinite (e.g. pi-edges in mode "rp")
+_fastmath = {'contract', 'reassoc', 'nsz', 'arcp'}
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _sky_to_cartesian(ra, dec, dist, conversion, out):
+    # Same as utils.sky_to_cartesian, in a single pass over the input arrays
+    for i in prange(ra.size):
+        cos_dec = np.cos(dec[i] * conversion)
+        out[0, i] = dist[i] * cos_dec * np.cos(ra[i] * conversion)
+        out[1, i] = dist[i] * cos_dec * np.sin(ra[i] * conversion)
+        out[2, i] = dist[i] * np.sin(dec[i] * conversion)
+
+
+@njit(fastmath=_fastmath)
+def _wrap(dx, boxsize):
+    # Minimum image convention
+    if dx > 0.5 * boxsize: return dx - boxsize
+    if dx < -0.5 * boxsize: return dx + boxsize
+    return dx
+
+
+@njit(fastmath=_fastmath, boundscheck=False)
+def _get_r2(positions2, x1, y1, z1, wrapx, wrapy, wrapz, boxsize, out):
+    # Squared distances between (x1, y1, z1) and positions2, without branches (but loop-invariant ones), such that LLVM vectorizes the loop.
+    # Kept as a separate function (and with 0-based indexing, as negative index wraparound prevents vectorization)
+    # as the loop is not vectorized within the parallel kernel.
+    for j in range(positions2.shape[0]):
+        dx = positions2[j, 0] - x1
+        dy = positions2[j, 1] - y1
+        dz = positions2[j, 2] - z1
+        if wrapx: dx = _wrap(dx, boxsize[0])
+        if wrapy: dy = _wrap(dy, boxsize[1])
+        if wrapz: dz = _wrap(dz, boxsize[2])
+        out[j] = dx * dx + dy * dy + dz * dz
+
+
+@njit(fastmath=_fastmath)
+def _get_lin_bin(value, lo, inv_width, nbins):
+    # Constant-time bin lookup for linear binning, ``bin_type = 'lin'``
+    return min(max(int((value - lo) * inv_width), 0), nbins - 1)
+
+
+@njit(fastmath=_fastmath)
+def _get_exact_lin_bin(value, edges, lo, inv_width, nbins):
+    # Same as above, but corrected (as in np.histogram) to match np.searchsorted(edges, value, side='right') - 1
+    ib = _get_lin_bin(value, lo, inv_width, nbins)
+    if value < edges[ib]: ib -= 1
+    elif value >= edges[ib + 1]: ib += 1
+    return ib
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pi_function(los):
+    # Return function computing the line-of-sight and (squared) transverse separations of a pair,
+    # specialized (at compile time) for line-of-sight los
+    if los in ['x', 'y', 'z']:
+        axis = 'xyz'.index(los)
+        axis1, axis2 = (axis + 1) % 3, (axis + 2) % 3
+
+        @njit(fastmath=_fastmath, inline='always')
+        def get_pi(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2):
+            d = (dx, dy, dz)
+            return d[axis], d[axis1] * d[axis1] + d[axis2] * d[axis2]
+
+        return get_pi
+
+    if los == 'midpoint':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_los(x1, y1, z1, x2, y2, z2):
+            return x1 + x2, y1 + y2, z1 + z2
+    elif los == 'firstpoint':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_los(x1, y1, z1, x2, y2, z2):
+            return x1, y1, z1
+    elif los == 'endpoint':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_los(x1, y1, z1, x2, y2, z2):
+            return x2, y2, z2
+    else:
+        raise TwoPointCounterError('Unknown line-of-sight {}'.format(los))
+
+    @njit(fastmath=_fastmath, inline='always')
+    def get_pi(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2):
+        lx, ly, lz = get_los(x1, y1, z1, x2, y2, z2)
+        # no branch: if the line-of-sight vanishes, so does dx * lx + dy * ly + dz * lz
+        pi = (dx * lx + dy * ly + dz * lz) / max(math.sqrt(lx * lx + ly * ly + lz * lz), 1e-300)
+        return pi, max(r2 - pi * pi, 0.)
+
+    return get_pi
+
+
+@functools.lru_cache(maxsize=None)
+def _get_bin_function(mode, los=None, lin0=False, lin1=False, squared0=False):
+    # Return function computing flattened bin index (-1 if the pair is not to be counted) and separation along the first axis,
+    # specialized (at compile time) for mode, line-of-sight los and linear binning along the first (lin0) and second (lin1) axes.
+    # If squared0, edges along the first axis are squared (Cartesian) separations, such that the pair is binned without square root
+    # (and arcsine in mode "theta"); the returned separation is then 0 (mode "s" or "theta", when separations are not to be averaged)
+
+    @njit(fastmath=_fastmath, inline='always')
+    def get_bin0(sep, edges0):
+        nbins0 = edges0.size - 1
+        if sep < edges0[0] or sep >= edges0[-1]: return -1
+        if lin0: return _get_lin_bin(sep, edges0[0], nbins0 / (edges0[-1] - edges0[0]), nbins0)
+        return np.searchsorted(edges0, sep, side='right') - 1
+
+    if squared0:
+        if mode not in ['s', 'theta']:
+            raise TwoPointCounterError('Binning in squared separations is not available in mode {}'.format(mode))
+
+        @njit(fastmath=_fastmath, inline='always')
+        def get_bin(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2, edges0, edges1):
+            if r2 < edges0[0] or r2 >= edges0[-1]: return -1, 0.
+            return np.searchsorted(edges0, r2, side='right') - 1, 0.
+
+        return get_bin
+
+    if mode == 'theta':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_bin(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2, edges0, edges1):
+            # positions are on the unit sphere: angle from chord length
+            sep = 2. * math.degrees(math.asin(min(0.5 * math.sqrt(r2), 1.)))
+            return get_bin0(sep, edges0), sep
+
+        return get_bin
+
+    if mode == 's':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_bin(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2, edges0, edges1):
+            sep = math.sqrt(r2)
+            return get_bin0(sep, edges0), sep
+
+        return get_bin
+
+    get_pi = _get_pi_function(los)
+
+    if mode == 'smu':
+        @njit(fastmath=_fastmath, inline='always')
+        def get_sep(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2):
+            pi, rp2 = get_pi(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2)
+            sep = math.sqrt(r2)
+            # no branch: if sep vanishes, so does pi
+            return sep, pi / max(sep, 1e-300)
+    else:
+        @njit(fastmath=_fastmath, inline='always')
+        def get_sep(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2):
+            pi, rp2 = get_pi(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2)
+            return math.sqrt(rp2), pi
+
+    @njit(fastmath=_fastmath, inline='always')
+    def get_bin(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2, edges0, edges1):
+        sep, value1 = get_sep(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2)
+        # first bin is exclusive on the low end
+        if value1 <= edges1[0] or value1 >= edges1[-1]: return -1, sep
+        ib0 = get_bin0(sep, edges0)
+        if ib0 < 0: return -1, sep
+        nbins1 = edges1.size - 1
+        if lin1: ib1 = _get_exact_lin_bin(value1, edges1, edges1[0], nbins1 / (edges1[-1] - edges1[0]), nbins1)
+        else: ib1 = np.searchsorted(edges1, value1, side='right') - 1
+        return ib0 * nbins1 + ib1, sep
+
+    return get_bin
+
+
+def _get_grid(positions1, positions2, smax, boxsize=None):
+    # Return number of cells along each axis, lower corner and inverse cell size of a grid
+    # whose cells are at least smax wide, such that all pairs to be counted are in neighboring cells.
+    ncells_max = max(int((positions1.shape[0] + positions2.shape[0])**(1. / 3.)), 1)
+    if boxsize is not None:
+        offset, extent = np.zeros(3, dtype='f8'), np.asarray(boxsize, dtype='f8')
+    else:
+        offset = np.minimum(positions1.min(axis=0), positions2.min(axis=0)).astype('f8')
+        extent = np.maximum(positions1.max(axis=0), positions2.max(axis=0)) - offset
+    ncells = np.ones(3, dtype='i8')
+    if np.isfinite(smax):
+        ncells = np.clip(np.floor(extent / smax), 1, ncells_max).astype('i8')
+    if boxsize is not None:
+        ncells[ncells < 3] = 1  # with periodic wrapping, neighboring cells must be distinct
+    inv_cellsize = np.zeros(3, dtype='f8')
+    mask = extent > 0.
+    inv_cellsize[mask] = ncells[mask] / extent[mask]
+    return ncells, offset, inv_cellsize
+
+
+def _build_grid(positions, ncells, offset, inv_cellsize):
+    # Return index sorting particles by cell (and by z within cells), and start / end indices of each cell in the sorted array
+    index = np.clip(((positions - offset) * inv_cellsize).astype('i8'), 0, ncells - 1)
+    cells = (index[:, 0] * ncells[1] + index[:, 1]) * ncells[2] + index[:, 2]
+    sort_idx = np.lexsort((positions[:, 2], cells))
+    cells = cells[sort_idx]
+    all_cells = np.arange(np.prod(ncells))
+    return np.searchsorted(cells, all_cells, side='left'), np.searchsorted(cells, all_cells, side='right'), sort_idx
+
+
+@njit(parallel=True, boundscheck=False)
+def _get_cell_bounds(positions, cell_start, cell_end):
+    # Return bounding box of the particles in each cell, of shape (ncells, 2, 3)
+    bounds = np.empty((cell_start.size, 2, 3), dtype=positions.dtype)
+    for icell in prange(cell_start.size):
+        for k in range(3):
+            bounds[icell, 0, k], bounds[icell, 1, k] = np.inf, -np.inf
+            for i in range(cell_start[icell], cell_end[icell]):
+                bounds[icell, 0, k] = min(bounds[icell, 0, k], positions[i, k])
+                bounds[icell, 1, k] = max(bounds[icell, 1, k], positions[i, k])
+    return bounds
+
+
+def _get_work(cell_start, cell_end, block_size):
+    # Split cells into blocks of at most block_size particles; return array of (cell, start, end)
+    counts = cell_end - cell_start
+    cells = np.flatnonzero(counts)
+    nblocks = (counts[cells] + block_size - 1) // block_size
+    cells = np.repeat(cells, nblocks)
+    iblock = np.arange(cells.size) - np.repeat(np.cumsum(nblocks) - nblocks, nblocks)
+    start = cell_start[cells] + iblock * block_size
+    end = np.minimum(start + block_size, cell_end[cells])
+    return np.column_stack([cells, start, end])
+
+
+@intrinsic
+def _popcount(typingctx, x):
+    # Number of 1 bits of integer x, as int64; LLVM ctpop, which is lowered to the hardware popcnt instruction
+    # (and vpopcntq when vectorized) if the host CPU supports it
+    if not isinstance(x, types.Integer):
+        return None
+
+    def codegen(context, builder, signature, args):
+        return context.cast(builder, builder.ctpop(args[0]), signature.args[0], signature.return_type)
+
+    return types.int64(x), codegen
+
+
+@functools.lru_cache(maxsize=None)
+def _get_weight_function(weight_type=None):
+    # Return function computing the weight of pair (i, j), specialized for weight_type (None, "product_individual" or "inverse_bitwise").
+    # weights1 (resp. weights2) is the tuple of individual weights (empty if None), (n, N) bitwise weights and their popcount for the first (resp. second) catalog;
+    # pip_attrs is the tuple of nrealizations, noffset, default_value and correction (empty if None) for weight_type "inverse_bitwise"
+    if weight_type is None:
+        @njit(inline='always')
+        def get_weight(weights1, i, weights2, j, pip_attrs):
+            return 1.
+
+    elif weight_type == 'product_individual':
+        @njit(inline='always')
+        def get_weight(weights1, i, weights2, j, pip_attrs):
+            return weights1[0][i] * weights2[0][j]
+
+    elif weight_type == 'inverse_bitwise':
+        @njit(inline='always')
+        def get_weight(weights1, i, weights2, j, pip_attrs):
+            w1, b1, c1 = weights1
+            w2, b2, c2 = weights2
+            nrealizations, noffset, default_value, correction = pip_attrs
+            denom = noffset
+            for k in range(b1.shape[0]): denom += _popcount(b1[k, i] & b2[k, j])
+            if denom == 0:
+                weight = default_value
+            else:
+                weight = nrealizations / denom
+                if correction.size: weight /= correction[c1[i], c2[j]]
+            if w1.size: weight *= w1[i] * w2[j]
+            return weight
+
+    else:
+        raise TwoPointCounterError('Unknown weight type {}'.format(weight_type))
+
+    return get_weight
+
+
+# Compiled pair-counting kernels, indexed by (mode, los, weight_type, bin_type, dtype)
+_KERNELS = {}
+
+
+def _get_count_pairs(mode, los=None, weight_type=None, bin_type=('lin', 'lin'), dtype='f8'):
+    # Return pair-counting kernel specialized for mode, line-of-sight los (None if irrelevant), weight_type (see _get_weight_function),
+    # bin types ("lin", "custom", or "squared" for edges in squared separations, see _get_bin_function) along the first and second axes
+    # and positions dtype; kernels are compiled once and stored in _KERNELS
+    key = (mode, los, weight_type, tuple(bin_type), np.dtype(dtype).str)
+    if key in _KERNELS:
+        return _KERNELS[key]
+    get_bin = _get_bin_function(mode, los=los, lin0=bin_type[0] == 'lin', lin1=bin_type[1] == 'lin', squared0=bin_type[0] == 'squared')
+    get_weight = _get_weight_function(weight_type)
+    # Floating type of the computation of separations; all floating-point inputs (but weights) are expected in this type
+    ftype = np.float32 if np.dtype(dtype).itemsize == 4 else np.float64
+
+    @njit(parallel=True, fastmath=_fastmath, boundscheck=False)
+    def count_pairs(positions1, weights1, positions2, weights2, pip_attrs, work, cell_start2, cell_end2, bounds2, ncells, smin, smax,
+                    edges0, edges1, boxsize, tile_size):
+        # Count pairs between catalogs 1 and 2, with (N, 3) C-contiguous positions sorted by cells (see _build_grid);
+        # return (flattened) number of pairs, weighted number of pairs and sum of weighted separations.
+        # Each block of particles (row of work) of catalog 1 is paired with particles in neighboring cells of catalog 2,
+        # skipping cells whose bounding box is further than smax, and exiting early along z (particles are sorted by z in each cell).
+        # Pairs of cells are processed by tiles of tile_size particles, for cache locality.
+        # For each particle of catalog 1, squared distances to the particles of the tile of catalog 2 are computed first in a
+        # branch-free (SIMD) loop, and only pairs within [smin, smax] are then binned, such that other pairs cost no square root.
+        # Blocks are dynamically scheduled (see _run); each thread accumulates in its own histogram (padded by a cache line,
+        # to avoid false sharing), without atomics; histograms are summed at the end.
+        nwork = work.shape[0]
+        nbins = (edges0.size - 1) * (edges1.size - 1)
+        nthreads = numba.get_num_threads()
+        ncounts = np.zeros((nthreads, nbins + 8), dtype=np.int64)
+        wcounts = np.zeros((nthreads, nbins + 8), dtype=np.float64)
+        sepsum = np.zeros((nthreads, nbins + 8), dtype=np.float64)
+        buffer = np.empty((nthreads, tile_size), dtype=positions2.dtype)
+        periodic = boxsize[0] > 0.
+        # With periodic wrapping, if there is a single cell along one axis, apply minimum image convention for each pair along this axis;
+        # else neighboring cells are shifted by the box size
+        wrapx, wrapy, wrapz = periodic and ncells[0] == 1, periodic and ncells[1] == 1, periodic and ncells[2] == 1
+        smin2, smax2 = smin * smin, smax * smax
+        for iwork in prange(nwork):
+            tid = numba.get_thread_id()
+            r2 = buffer[tid]  # squared distances within the current tile
+            icell1, start1, end1 = work[iwork, 0], work[iwork, 1], work[iwork, 2]
+            ix1, iy1, iz1 = icell1 // (ncells[1] * ncells[2]), (icell1 // ncells[2]) % ncells[1], icell1 % ncells[2]
+            # bounding box of the block
+            lox, loy, loz = positions1[start1, 0], positions1[start1, 1], positions1[start1, 2]
+            hix, hiy, hiz = lox, loy, loz
+            for i in range(start1 + 1, end1):
+                lox, hix = min(lox, positions1[i, 0]), max(hix, positions1[i, 0])
+                loy, hiy = min(loy, positions1[i, 1]), max(hiy, positions1[i, 1])
+                loz, hiz = min(loz, positions1[i, 2]), max(hiz, positions1[i, 2])
+            for ox in range(-1 if ncells[0] > 1 else 0, 2 if ncells[0] > 1 else 1):
+                ix2 = ix1 + ox
+                if not periodic and (ix2 < 0 or ix2 >= ncells[0]): continue
+                sx = boxsize[0] * ftype(math.floor(ix2 / ncells[0])) if periodic else ftype(0.)
+                ix2 %= ncells[0]
+                for oy in range(-1 if ncells[1] > 1 else 0, 2 if ncells[1] > 1 else 1):
+                    iy2 = iy1 + oy
+                    if not periodic and (iy2 < 0 or iy2 >= ncells[1]): continue
+                    sy = boxsize[1] * ftype(math.floor(iy2 / ncells[1])) if periodic else ftype(0.)
+                    iy2 %= ncells[1]
+                    for oz in range(-1 if ncells[2] > 1 else 0, 2 if ncells[2] > 1 else 1):
+                        iz2 = iz1 + oz
+                        if not periodic and (iz2 < 0 or iz2 >= ncells[2]): continue
+                        sz = boxsize[2] * ftype(math.floor(iz2 / ncells[2])) if periodic else ftype(0.)
+                        iz2 %= ncells[2]
+                        icell2 = (ix2 * ncells[1] + iy2) * ncells[2] + iz2
+                        start2, end2 = cell_start2[icell2], cell_end2[icell2]
+                        if start2 == end2: continue
+                        # distance between bounding boxes
+                        ddx = 0. if wrapx else max(bounds2[icell2, 0, 0] + sx - hix, lox - bounds2[icell2, 1, 0] - sx, 0.)
+                        ddy = 0. if wrapy else max(bounds2[icell2, 0, 1] + sy - hiy, loy - bounds2[icell2, 1, 1] - sy, 0.)
+                        ddz = 0. if wrapz else max(bounds2[icell2, 0, 2] + sz - hiz, loz - bounds2[icell2, 1, 2] - sz, 0.)
+                        if ddx * ddx + ddy * ddy + ddz * ddz > smax2: continue
+                        # Loop over tiles of tile_size particles of catalogs 1 and 2, small enough to stay in L1 cache together;
+                        # particles are sorted by z, so tiles further than smax along z can be skipped altogether
+                        for i0 in range(start1, end1, tile_size):
+                            i1 = min(i0 + tile_size, end1)
+                            for j0 in range(start2, end2, tile_size):
+                                j1 = min(j0 + tile_size, end2)
+                                if not wrapz:
+                                    if positions2[j1 - 1, 2] + sz < positions1[i0, 2] - smax: continue
+                                    if positions2[j0, 2] + sz > positions1[i1 - 1, 2] + smax: break
+                                for i in range(i0, i1):
+                                    x1, y1, z1 = positions1[i, 0], positions1[i, 1], positions1[i, 2]
+                                    jstart, jend = j0, j1
+                                    if not wrapz:
+                                        while jstart < jend and positions2[jstart, 2] + sz < z1 - smax: jstart += 1
+                                        while jend > jstart and positions2[jend - 1, 2] + sz > z1 + smax: jend -= 1
+                                    # First pass, without branches (hence vectorized): squared distances
+                                    _get_r2(positions2[jstart:jend], x1 - sx, y1 - sy, z1 - sz, wrapx, wrapy, wrapz, boxsize, r2[jstart - j0:jend - j0])
+                                    # Second pass: binning of the pairs within [smin, smax] only
+                                    for j in range(jstart, jend):
+                                        if r2[j - j0] > smax2 or r2[j - j0] < smin2: continue
+                                        x2, y2, z2 = positions2[j, 0] + sx, positions2[j, 1] + sy, positions2[j, 2] + sz
+                                        dx, dy, dz = x2 - x1, y2 - y1, z2 - z1
+                                        if wrapx: dx = _wrap(dx, boxsize[0])
+                                        if wrapy: dy = _wrap(dy, boxsize[1])
+                                        if wrapz: dz = _wrap(dz, boxsize[2])
+                                        ib, sep = get_bin(x1, y1, z1, x2, y2, z2, dx, dy, dz, r2[j - j0], edges0, edges1)
+                                        if ib < 0: continue
+                                        weight = get_weight(weights1, i, weights2, j, pip_attrs)
+                                        ncounts[tid, ib] += 1
+                                        wcounts[tid, ib] += weight
+                                        sepsum[tid, ib] += weight * sep
+        return ncounts[:, :nbins].sum(axis=0), wcounts[:, :nbins].sum(axis=0), sepsum[:, :nbins].sum(axis=0)
+
+    _KERNELS[key] = count_pairs
+    return count_pairs
+
+
+class NumbaTwoPointCounter(BaseTwoPointCounter):
+
+    """Extend :class:`BaseTwoPointCounter` for two-point counting with Numba-compiled kernels."""
+
+    name = 'numba'
+
+    def _get_max_separation(self):
+        # Maximum Cartesian separation (on the unit sphere if mode is "theta") of pairs to be counted
+        smax = np.max(self.edges[0])
+        if self.mode == 'theta':
+            smax = 2 * np.sin(0.5 * np.deg2rad(min(smax, 180.)))
+        elif self.mode == 'rppi':
+            smax = np.sqrt(smax**2 + np.max(np.abs(self.edges[1]))**2)
+        elif self.mode == 'rp':
+            smax = np.inf
+        return smax * (1. + 1e-5)  # margin for rounding errors
+
+    def _get_min_separation(self):
+        # Minimum Cartesian separation (on the unit sphere if mode is "theta") of pairs to be counted;
+        # in modes "rppi" and "rp", rp <= s so the minimum rp is a lower bound
+        smin = np.min(self.edges[0])
+        if smin <= 0.: return 0.
+        if self.mode == 'theta':
+            if smin >= 180.: return np.inf
+            smin = 2 * np.sin(0.5 * np.deg2rad(smin))
+        return smin * (1. - 1e-5)  # margin for rounding errors
+
+    def _get_squared_edges(self):
+        # Squared Cartesian separations (chord lengths on the unit sphere if mode is "theta") corresponding to edges along the first axis
+        edges = self.edges[0]
+        if self.mode == 'theta':
+            edges = np.where(edges > 0., 2 * np.sin(0.5 * np.deg2rad(np.clip(edges, 0., 180.))), 0.)
+            edges[self.edges[0] > 180.] = np.inf
+            return np.where(self.edges[0] < 0., -np.inf, edges**2)
+        return np.where(edges < 0., -np.inf, edges**2)
+
+    def _check_supported(self):
+        # Raise TwoPointCounterError for options not supported by this engine
+        if self.cos_twopoint_weights is not None:
+            raise TwoPointCounterError('{} engine does not support twopoint weights'.format(self.name))
+        if self.selection_attrs:
+            raise TwoPointCounterError('{} engine does not support selection_attrs'.format(self.name))
+
+    def _get_positions_weights(self):
+        # Return (N, 3) C-contiguous positions (Cartesian, on the unit sphere if mode is "theta") and weights of both catalogs on the local process;
+        # weights are the tuple of individual weights (float64, empty if None), bitwise weights as a contiguous (n, N) uint64 array
+        # and their popcount (empty if no bitwise weights); positions2, weights2 are positions1, weights1 in case of autocorrelation
+        if self.ndim == 2:
+            self.compute_sepsavg[1] = False
+
+        (dpositions1, dweights1), (dpositions2, dweights2) = self._mpi_decompose()
+
+        def get_positions(positions):
+            if self.mode == 'theta':  # project onto the unit sphere
+                positions = utils.sky_to_cartesian([positions[0], positions[1], np.ones_like(positions[0])], degree=True, dtype=self.dtype)
+            # Single (N, 3) buffer, such that the coordinates of each particle are read from the same cache line
+            toret = utils.empty_aligned((len(positions[0]), 3), dtype=self.dtype)
+            for icoord, position in enumerate(positions): toret[:, icoord] = position
+            positions = toret
+            if self.periodic:
+                positions %= self.boxsize.astype(self.dtype)
+            return positions
+
+        def get_weights(weights, size):
+            individual_weights = np.empty(0, dtype='f8')
+            if len(weights) > self.n_bitwise_weights:
+                individual_weights = np.asarray(weights[self.n_bitwise_weights], dtype='f8')
+            bitwise_weights = utils.reformat_bitarrays(*weights[:self.n_bitwise_weights], dtype=np.uint64)
+            bitwise_weights = np.array(bitwise_weights, dtype=np.uint64).reshape(len(bitwise_weights), size)
+            popcounts = np.empty(0, dtype='i8')
+            if self.n_bitwise_weights:
+                popcounts = utils.popcount(*bitwise_weights).astype('i8')
+            return individual_weights, bitwise_weights, popcounts
+
+        dpositions1 = get_positions(dpositions1)
+        dweights1 = get_weights(dweights1, len(dpositions1))
+        if dpositions2 is None:
+            dpositions2, dweights2 = dpositions1, dweights1
+        else:
+            dpositions2 = get_positions(dpositions2)
+            dweights2 = get_weights(dweights2, len(dpositions2))
+        return dpositions1, dweights1, dpositions2, dweights2
+
+    def _set_counts(self, ncounts, wcounts, sepsum):
+        # Set :attr:`ncounts`, :attr:`wcounts` and :attr:`sep` given counts on the local process (flattened, float64 wcounts and sepsum)
+        self.ncounts, self.wcounts, sepsum = ncounts.reshape(self.shape), wcounts.reshape(self.shape), sepsum.reshape(self.shape)
+
+        if self.with_mpi:
+            self.ncounts = self.mpicomm.allreduce(self.ncounts)
+            self.wcounts = self.mpicomm.allreduce(self.wcounts)
+            sepsum = self.mpicomm.allreduce(sepsum)
+
+        with_auto_pairs = (self.autocorr or getattr(self, 'same_shotnoise', False)) and self.edges[0][0] <= 0.
+        if self.ndim == 2:
+            with_auto_pairs &= self.edges[1][0] < 0. < self.edges[1][-1]
+
+        if with_auto_pairs:  # remove auto-pairs, which are in the mu = 0 (pi = 0) bin
+            index_zero = 0
+            if self.ndim == 2: index_zero = np.searchsorted(self.edges[1], 0., side='right') - 1
+            self.ncounts.flat[index_zero] -= self.size1
+            self.wcounts.flat[index_zero] -= self._sum_auto_weights()
+
+        self.wcounts[self.ncounts == 0] = 0.  # as above may create uncertainty
+        if self.compute_sepavg:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.sep = sepsum / self.wcounts
+            self.sep[self.ncounts == 0] = np.nan
+
+    def run(self):
+        """Compute the two-point counts and set :attr:`wcounts` and :attr:`sep`."""
+        self._run(dict(self.attrs))
+
+    def _run(self, attrs):
+        # attrs are the engine-specific arguments, that are not read yet
+        self._check_supported()
+        # Tiles of ~ 1.5 kB per coordinate, such that tiles of both catalogs fit in L1 cache
+        tile_size = attrs.pop('tile_size', None)
+        if tile_size is None: tile_size = 64 if np.dtype(self.dtype).itemsize > 4 else 128
+        tile_size = int(tile_size)
+        if tile_size < 1:
+            raise TwoPointCounterError('tile_size must be >= 1, found {:d}'.format(tile_size))
+        if attrs:
+            import warnings
+            warnings.warn('These arguments are not read: {}'.format(attrs))
+
+        dpositions1, dweights1, dpositions2, dweights2 = self._get_positions_weights()
+        autocorr = dpositions2 is dpositions1
+
+        bin_type = (self.bin_type, 'custom')
+        if self.ndim == 2:
+            edges1 = self.edges[1]
+            if _is_linear(edges1): bin_type = (self.bin_type, 'lin')  # same test as for bin_type = 'auto'
+        else:
+            edges1 = np.array([-np.inf, np.inf], dtype='f8')
+        edges0 = self.edges[0]
+        # If separations are not to be averaged, with custom binning, search squared separations directly in squared edges,
+        # without square root (and arcsine in mode "theta"); with linear binning, the linear bin index is cheaper than the binary search
+        if not self.compute_sepavg and self.mode in ['s', 'theta'] and self.bin_type != 'lin':
+            edges0, bin_type = self._get_squared_edges(), ('squared', bin_type[1])
+
+        ncounts, wcounts, sepsum = np.zeros(self.shape, dtype='i8'), np.zeros(self.shape, dtype='f8'), np.zeros(self.shape, dtype='f8')
+        if dpositions1.shape[0] and dpositions2.shape[0]:
+            smax = self._get_max_separation()
+            boxsize = self.boxsize if self.periodic else None
+            ncells, offset, inv_cellsize = _get_grid(dpositions1, dpositions2, smax, boxsize=boxsize)
+
+            def sort_in_cells(positions, weights):
+                cell_start, cell_end, sort_idx = _build_grid(positions, ncells, offset, inv_cellsize)
+
+                def take(array):
+                    # Sorted copy, starting on a cache line (64 bytes), hence aligned for SIMD loads
+                    if not array.size: return array
+                    return np.take(array, sort_idx, axis=0 if array is positions else -1, out=utils.empty_aligned(array.shape, dtype=array.dtype))
+
+                return take(positions), tuple(take(weight) for weight in weights), cell_start, cell_end
+
+            dpositions1, dweights1, cell_start1, cell_end1 = sort_in_cells(dpositions1, dweights1)
+            if autocorr:
+                dpositions2, dweights2, cell_start2, cell_end2 = dpositions1, dweights1, cell_start1, cell_end1
+            else:
+                dpositions2, dweights2, cell_start2, cell_end2 = sort_in_cells(dpositions2, dweights2)
+            bounds2 = _get_cell_bounds(dpositions2, cell_start2, cell_end2)
+            # Small enough blocks for dynamic scheduling to balance the load between threads, even if there are few (dense) cells
+            block_size = max(dpositions1.shape[0] // (16 * self.nthreads), 1)
+            work = _get_work(cell_start1, cell_end1, block_size)
+
+            weight_type = None
+            if self.n_bitwise_weights: weight_type = 'inverse_bitwise'
+            elif dweights1[0].size: weight_type = 'product_individual'
+            pip_attrs = (1., 0, 0., np.empty((0, 0), dtype='f8'))
+            if self.n_bitwise_weights:
+                correction = self.weight_attrs.get('correction', None)
+                correction = np.empty((0, 0), dtype='f8') if correction is None else np.asarray(correction, dtype='f8')
+                pip_attrs = (float(self.weight_attrs['nrealizations']), int(self.weight_attrs['noffset']), float(self.weight_attrs['default_value']), correction)
+            count_pairs = _get_count_pairs(self.mode, los=self.los_type if self.mode in ['smu', 'rppi', 'rp'] else None,
+                                           weight_type=weight_type, bin_type=bin_type, dtype=self.dtype)
+            # Separations are computed in the positions dtype (float32 if dtype is 'f4'), histograms are int64 / float64
+            ftype = np.dtype(self.dtype).type
+            # Number of threads is set for this call only, and restored afterwards
+            nthreads = numba.get_num_threads()
+            numba.set_num_threads(max(min(self.nthreads, numba.config.NUMBA_NUM_THREADS), 1))
+            try:
+                # Blocks (rows of work) are handed out to threads one at a time, as the number of pairs per block varies a lot
+                with numba.parallel_chunksize(1):
+                    ncounts, wcounts, sepsum = count_pairs(dpositions1, dweights1, dpositions2, dweights2, pip_attrs, work, cell_start2, cell_end2, bounds2, ncells,
+                                                           ftype(self._get_min_separation()), ftype(smax), edges0.astype(ftype), edges1.astype(ftype), np.zeros(3, dtype=ftype) if boxsize is None else boxsize.astype(ftype), tile_size)
+            finally:
+                numba.set_num_threads(nthreads)
+
+        self._set_counts(ncounts, wcounts, sepsum)
@@ -6,7 +6,7 @@ import pytest
 import numpy as np
 
 from pycorr import TwoPointCounter, AnalyticTwoPointCounter, utils, setup_logging
-from pycorr.twopoint_counter import TwoPointCounterError, BaseTwoPointCounter, get_inverse_probability_weight, normalization
+from pycorr.twopoint_counter import TwoPointCounterError, BaseTwoPointCounter, get_inverse_probability_weight, normalization, _format_positions, _format_weights
 
 
 def diff(position2, position1):
@@ -338,7 +338,7 @@ def test_twopoint_counter(mode='s'):
             weights_one = options.pop('weights_one', [])
             n_individual_weights = options.pop('n_individual_weights', 0)
             n_bitwise_weights = options.pop('n_bitwise_weights', 0)
-            data1, data2 = generate_catalogs(size, boxsize=cboxsize, n_individual_weights=n_individual_weights, n_bitwise_weights=n_bitwise_weights)
+            data1, data2 = generate_catalogs(size, boxsize=options.get('boxsize', cboxsize), n_individual_weights=n_individual_weights, n_bitwise_weights=n_bitwise_weights)
             data1 = [np.concatenate([d, d]) for d in data1]  # that will get us some pairs at sep = 0
 
             autocorr = options.pop('autocorr', False)
@@ -709,6 +709,145 @@ def test_twopoint_counter(mode='s'):
                 assert np.allclose(test_mpi.wnorm, test.wnorm, **tol)
 
 
+def test_numba(mode='s'):
+
+    ref_func = {'theta': ref_theta, 's': ref_s, 'smu': ref_smu, 'rppi': ref_rppi, 'rp': ref_rp}[mode]
+    ref_edges = np.linspace(0., 100., 21)
+    custom_edges = np.array([0., 8., 20., 42., 60.])
+    if mode == 'theta':
+        ref_edges = np.linspace(0., 10., 11)
+        custom_edges = np.array([0., 0.5, 2., 4.5, 10.])
+    elif mode == 'smu':
+        ref_edges = (ref_edges, np.linspace(-1., 1., 21))
+        custom_edges = (custom_edges, np.linspace(-0.8, 0.8, 9))
+    elif mode == 'rppi':
+        ref_edges = (ref_edges, np.linspace(-80., 80., 21))
+        custom_edges = (custom_edges, np.linspace(-90., 90., 9))
+    min_edges = (ref_edges[0][2:], ref_edges[1]) if np.ndim(ref_edges[0]) else ref_edges[2:]
+    size = 100
+    cboxsize = (300.,) * 3
+
+    list_options = []
+    for autocorr in [False, True]:
+        list_options.append({'autocorr': autocorr})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 2, 'nthreads': 4})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'compute_sepsavg': False})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'edges': custom_edges, 'bin_type': 'custom'})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'edges': custom_edges, 'bin_type': 'custom', 'compute_sepsavg': False})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'edges': min_edges})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'dtype': 'f4'})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'tile_size': 3})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'n_bitwise_weights': 2})
+        list_options.append({'autocorr': autocorr, 'n_bitwise_weights': 1, 'weight_attrs': {'nrealizations': 129, 'noffset': 3}})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'n_bitwise_weights': 2, 'weight_attrs': {'noffset': 0, 'default_value': 0.8}})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'n_bitwise_weights': 2, 'weight_attrs': {'normalization': 'counter'}})
+        if mode != 'theta':
+            list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'boxsize': cboxsize, 'los': 'x'})
+        if mode in ['s', 'smu', 'rppi']:
+            # large box compared to edges: several cells per dimension, such that neighbour cells are shifted by the box size
+            small_edges = {'s': np.linspace(0., 50., 11), 'smu': (np.linspace(0., 50., 11), np.linspace(-1., 1., 21)),
+                           'rppi': (np.linspace(0., 50., 11), np.linspace(-50., 50., 21))}[mode]
+            list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'boxsize': (1000.,) * 3, 'los': 'x', 'edges': small_edges})
+        if mode in ['smu', 'rppi', 'rp']:
+            for los in ['firstpoint', 'endpoint', 'y']:
+                list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'los': los})
+
+    for options in list_options:
+        print(mode, options)
+        options = options.copy()
+        autocorr = options.pop('autocorr')
+        edges = options.pop('edges', ref_edges)
+        n_individual_weights = options.pop('n_individual_weights', 0)
+        n_bitwise_weights = options.pop('n_bitwise_weights', 0)
+        data1, data2 = generate_catalogs(size, boxsize=cboxsize, n_individual_weights=n_individual_weights, n_bitwise_weights=n_bitwise_weights)
+        data1 = [np.concatenate([d, d]) for d in data1]  # that will get us some pairs at sep = 0
+        if 'default_value' in options.get('weight_attrs', {}):
+            for w in data1[3: 3 + n_bitwise_weights] + data2[3: 3 + n_bitwise_weights]: w[:] = 0  # set to zero to make sure default_value is used
+        dtype = options.get('dtype', 'f8')
+        data1, data2 = ([np.asarray(d, dtype=dtype) if np.issubdtype(d.dtype, np.floating) else d for d in data] for data in [data1, data2])
+        boxsize = options.get('boxsize', None)
+        los = options.get('los', 'midpoint')
+        compute_sepavg = options.get('compute_sepsavg', True)
+        test = TwoPointCounter(mode=mode, edges=edges, engine='numba', positions1=data1[:3], positions2=None if autocorr else data2[:3],
+                               weights1=data1[3:], weights2=None if autocorr else data2[3:], position_type='xyz', **options)
+        weight_attrs = {}
+        if n_bitwise_weights:
+            weight_attrs = {name: test.weight_attrs[name] for name in ['nrealizations', 'noffset', 'default_value', 'correction']}
+        wcounts_ref, sep_ref = ref_func(edges, data1, data2=None if autocorr else data2, boxsize=boxsize, los=los, autocorr=autocorr,
+                                        n_bitwise_weights=n_bitwise_weights, **weight_attrs)
+        tol = {'atol': 1e-5, 'rtol': 1e-2} if dtype == 'f4' else {'atol': 1e-8, 'rtol': 1e-6}
+        assert np.allclose(test.wcounts, wcounts_ref, **tol)
+        if compute_sepavg:
+            assert np.allclose(test.sep, sep_ref, equal_nan=True, **tol)
+
+    data1, data2 = generate_catalogs(size, n_individual_weights=1)
+    test = TwoPointCounter(mode=mode, edges=ref_edges, engine='numba', positions1=data1[:3], positions2=data2[:3],
+                           weights1=data1[3:], weights2=data2[3:], position_type='xyz', dtype='f4')
+    data1, data2 = ([np.asarray(d, dtype='f4') for d in data] for data in [data1, data2])
+    ref = TwoPointCounter(mode=mode, edges=ref_edges, engine='numba', positions1=data1[:3], positions2=data2[:3],
+                          weights1=data1[3:], weights2=data2[3:], position_type='xyz', dtype='f4')
+    assert np.allclose(test.wcounts, ref.wcounts)
+
+    # number of threads is restored after the counts
+    import numba
+    nthreads = numba.get_num_threads()
+    TwoPointCounter(mode=mode, edges=ref_edges, engine='numba', positions1=data1[:3], weights1=data1[3:], position_type='xyz', nthreads=1)
+    assert numba.get_num_threads() == nthreads
+
+    # no validation of inputs (as for jackknife realizations)
+    from pycorr.numba_engine import NumbaTwoPointCounter
+    test = NumbaTwoPointCounter.__new__(NumbaTwoPointCounter)
+    test._validate = False
+    test.__init__(mode=mode, edges=ref_edges, positions1=data1[:3], positions2=data2[:3], weights1=data1[3:], weights2=data2[3:], position_type='xyz', dtype='f4')
+    assert np.allclose(test.wcounts, ref.wcounts)
+
+    data1 = generate_catalogs(size, n_individual_weights=1)[0]
+    with pytest.raises(TwoPointCounterError):
+        TwoPointCounter(mode=mode, edges=ref_edges, engine='numba', positions1=data1[:3], weights1=data1[3:], position_type='xyz', selection_attrs={'theta': (0., 5.)})
+
+
+def test_cupy(mode='s'):
+
+    # runs on GPU for mode = "s" if cupy is installed, else falls back to the numba engine
+    ref_func = {'s': ref_s, 'smu': ref_smu}[mode]
+    ref_edges = np.linspace(0., 100., 21)
+    if mode == 'smu':
+        ref_edges = (ref_edges, np.linspace(-1., 1., 21))
+    size = 100
+    cboxsize = (300.,) * 3
+
+    list_options = []
+    for autocorr in [False, True]:
+        list_options.append({'autocorr': autocorr})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'bin_type': 'custom'})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'dtype': 'f4'})
+        list_options.append({'autocorr': autocorr, 'n_individual_weights': 1, 'boxsize': cboxsize, 'los': 'x'})
+
+    for options in list_options:
+        options = options.copy()
+        autocorr = options.pop('autocorr')
+        n_individual_weights = options.pop('n_individual_weights', 0)
+        data1, data2 = generate_catalogs(size, boxsize=cboxsize, n_individual_weights=n_individual_weights)
+        dtype = options.get('dtype', 'f8')
+        data1, data2 = ([np.asarray(d, dtype=dtype) for d in data] for data in [data1, data2])
+        wcounts_ref, sep_ref = ref_func(ref_edges, data1, data2=None if autocorr else data2, boxsize=options.get('boxsize', None), los=options.get('los', 'midpoint'), autocorr=autocorr)
+        test = TwoPointCounter(mode=mode, edges=ref_edges, engine='cupy', positions1=data1[:3], positions2=None if autocorr else data2[:3],
+                               weights1=data1[3:], weights2=None if autocorr else data2[3:], position_type='xyz', **options)
+        tol = {'atol': 1e-5, 'rtol': 1e-2} if dtype == 'f4' else {'atol': 1e-8, 'rtol': 1e-6}
+        assert np.allclose(test.wcounts, wcounts_ref, **tol)
+        assert np.allclose(test.sep, sep_ref, equal_nan=True, **tol)
+
+
+def test_cupy_gpu(caplog):
+
+    # same as test_cupy, but on GPU only: skipped (rather than falling back to the numba engine) if cupy is not installed
+    pytest.importorskip('cupy')
+    import logging
+    with caplog.at_level(logging.INFO):
+        test_cupy(mode='s')
+    assert 'falling back' not in caplog.text
+
+
 def test_gpu(mode='smu'):
 
     ref_func = {'theta': ref_theta, 's': ref_s, 'smu': ref_smu, 'rppi': ref_rppi, 'rp': ref_rp}[mode]
@@ -1127,6 +1266,28 @@ def test_smu():
     print(counts_auto.ncounts - counts_ref.ncounts)
 
 
+def test_format_positions():
+    rng = np.random.RandomState(seed=42)
+    positions = [rng.uniform(0., 1., 10).astype(dtype) for dtype in ['f4', 'f8', 'f4']]
+    # mixed float32 / float64 inputs are upcast to the common type
+    formatted = _format_positions(positions, mode='s', position_type='xyz')
+    assert all(p.dtype == np.float64 for p in formatted)
+    assert np.allclose(formatted, positions)
+    formatted = _format_positions(positions, mode='s', position_type='xyz', dtype='f4')
+    assert all(p.dtype == np.float32 for p in formatted)
+    with pytest.raises(TwoPointCounterError, match='same size'):
+        _format_positions([positions[0], positions[1][:5], positions[2]], mode='s', position_type='xyz')
+    with pytest.raises(TwoPointCounterError, match='1D'):
+        _format_positions([p.reshape(2, 5) for p in positions], mode='s', position_type='xyz')
+    with pytest.raises(TwoPointCounterError, match='floating type'):
+        _format_positions([np.arange(10)] * 3, mode='s', position_type='xyz')
+    bitwise_weights = [rng.randint(0, 2**31, 10, dtype='i8') for i in range(2)]
+    weights, n_bitwise_weights = _format_weights(bitwise_weights, size=10)
+    assert n_bitwise_weights == 16 and all(w.dtype == np.uint8 for w in weights)
+    with pytest.raises(ValueError, match='same size'):
+        _format_weights([bitwise_weights[0], bitwise_weights[1][:5]], size=10)
+
+
 def test_rebin():
     boxsize = 1000.
     mode = 's'
@@ -1160,9 +1321,15 @@ if __name__ == '__main__':
     for mode in ['theta', 's', 'smu', 'rppi', 'rp']:
         test_twopoint_counter(mode=mode)
 
+    for mode in ['theta', 's', 'smu', 'rppi', 'rp']:
+        test_numba(mode=mode)
+    for mode in ['s', 'smu']:
+        test_cupy(mode=mode)
+
     for mode in ['s', 'smu', 'rppi']:
         test_analytic_twopoint_counter(mode=mode)
 
+    test_format_positions()
     test_rebin()
     test_pip_normalization()
     test_pip_counts()
@@ -10,6 +10,10 @@ def test_sky_cartesian():
     positions = [rng.uniform(0., 2., 100) for i in range(3)]
     rdd = utils.cartesian_to_sky(positions)
     assert np.allclose(utils.sky_to_cartesian(rdd), positions)
+    positions = [rng.uniform(0., 2., 1000001) for i in range(3)]  # numba path, if numba is imported
+    rdd = utils.cartesian_to_sky(positions)
+    assert np.allclose(utils.sky_to_cartesian(rdd), positions)
+    assert np.allclose(utils.sky_to_cartesian(rdd[:2] + [1.], dtype='f4'), positions / utils.distance(positions), atol=1e-6)
 
 
 def test_packbit():
@@ -180,6 +184,17 @@ def test_rebin():
     rarray = utils.rebin(array, shape, statistic=np.sum)
     assert rarray.shape == shape
     assert np.all(rarray == 10)
+    array = np.arange(4 * 6 * 10, dtype='f8').reshape(4, 6, 10)
+    shape = (2, 3, 5)
+    rarray = utils.rebin(array, shape, statistic=np.mean)
+    assert np.allclose(rarray, array.reshape(2, 2, 3, 2, 5, 2).mean(axis=-1).mean(axis=-2).mean(axis=-3))
+
+
+def test_empty_aligned():
+    for shape, dtype in [(10, 'f8'), ((3, 7), 'f4'), (0, 'u8')]:
+        array = utils.empty_aligned(shape, dtype=dtype, alignment=64)
+        assert array.shape == np.empty(shape).shape and array.dtype == np.dtype(dtype)
+        assert array.flags.c_contiguous and (array.size == 0 or array.ctypes.data % 64 == 0)
 
 
 if __name__ == '__main__':
@@ -191,3 +206,4 @@ if __name__ == '__main__':
     test_reformatbit()
     test_pack_unpack()
     test_rebin()
+    test_empty_aligned()
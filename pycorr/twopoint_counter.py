@@ -1,6 +1,7 @@
 """Implements base two-point counter, to be extended when implementing a new engine."""
 
 import os
+import importlib
 import time
 from collections import namedtuple
 
@@ -18,6 +19,10 @@ class TwoPointCounterError(ValueError):
     """Exception raised when issue with two-point counting."""
 
 
+# Modules implementing two-point counter engines, imported on first use (as they may require optional dependencies)
+_engine_modules = {'corrfunc': 'corrfunc', 'numba': 'numba_engine', 'cupy': 'cupy_engine'}
+
+
 def get_twopoint_counter(engine='corrfunc'):
     """
     Return :class:`BaseTwoPointCounter`-subclass corresponding to input engine name.
@@ -25,7 +30,7 @@ def get_twopoint_counter(engine='corrfunc'):
     Parameters
     ----------
     engine : string, default='corrfunc'
-        Name of two-point counter engine, one of ["corrfunc", "analytic", "jackknife"].
+        Name of two-point counter engine, one of ["corrfunc", "numba", "cupy", "analytic", "jackknife"].
 
     Returns
     -------
@@ -34,11 +39,13 @@ def get_twopoint_counter(engine='corrfunc'):
     """
     if isinstance(engine, str):
 
-        if engine.lower() == 'corrfunc':
-            from . import corrfunc  # adds counter to BaseTwoPointCounter._registry
+        name = engine.lower()
+        if name not in BaseTwoPointCounter._registry and name in _engine_modules:
+            # importing the module (once) adds counter to BaseTwoPointCounter._registry
+            importlib.import_module('.{}'.format(_engine_modules[name]), package=__package__)
 
         try:
-            engine = BaseTwoPointCounter._registry[engine.lower()]
+            engine = BaseTwoPointCounter._registry[name]
         except KeyError:
             raise TwoPointCounterError('Unknown two-point counter {}.'.format(engine))
 
@@ -72,7 +79,7 @@ class TwoPointCounter(BaseClass, metaclass=MetaTwoPointCounter):
     Parameters
     ----------
     engine : string, default='corrfunc'
-        Name of two-point counter engine, one of ["corrfunc", "analytical"].
+        Name of two-point counter engine, one of ["corrfunc", "numba", "cupy", "analytical"].
 
     args : list
         Arguments for two-point counter engine, see :class:`BaseTwoPointCounter`.
@@ -94,6 +101,12 @@ class TwoPointCounter(BaseClass, metaclass=MetaTwoPointCounter):
         return new
 
 
+def _is_linear(edges):
+    # Whether input edges have constant bin width, up to rtol = 1e-05 and atol = 1e-08; no need to build np.linspace(edges[0], edges[-1], len(edges))
+    diff = np.diff(edges)
+    return bool(diff.size) and np.max(np.abs(diff - diff[0])) <= 1e-5 * abs(diff[0]) + 1e-8
+
+
 def _vlogical_and(*arrays):
     # & between any number of arrays
     toret = arrays[0].copy()
@@ -152,9 +165,10 @@ def get_inverse_probability_weight(*weights, noffset=1, nrealizations=None, defa
     return toret
 
 
-def _format_positions(positions, mode='auto', position_type='xyz', dtype=None, copy=True, mpicomm=None, mpiroot=None):
+def _format_positions(positions, mode='auto', position_type='xyz', dtype=None, copy=True, validate=True, mpicomm=None, mpiroot=None):
     # Format input array of positions
     # position_type in ["xyz", "rdd", "pos"]
+    # If not validate, positions are assumed to be a list of 1D floating arrays of the same size, and are not checked
     mode = mode.lower()
     position_type = position_type.lower()
     if position_type == 'auto':
@@ -164,28 +178,30 @@ def _format_positions(positions, mode='auto', position_type='xyz', dtype=None, c
     def __format_positions(positions):
         pt = position_type
         if position_type == 'pos':  # array of shape (N, 3)
-            positions = np.array(positions, dtype=dtype, copy=copy)
+            positions = np.array(positions, dtype=dtype, copy=True) if copy else np.asarray(positions, dtype=dtype)
             if positions.shape[-1] != 3:
                 return None, 'For position type = {}, please provide a (N, 3) array for positions'.format(position_type)
             positions = positions.T
             pt = 'xyz'
         # Array of shape (3, N)
-        positions = list(positions)
-        for ip, p in enumerate(positions):
-            # Cast to the input dtype if exists (may be set by previous positions)
-            positions[ip] = np.array(p, dtype=dtype, copy=copy)
-
-        size = len(positions[0])
-        dt = positions[0].dtype
-        if not np.issubdtype(dt, np.floating):
-            return None, 'Input position arrays should be of floating type, not {}'.format(dt)
-        for p in positions[1:]:
-            if len(p) != size:
-                return None, 'All position arrays should be of the same size'
-            if p.dtype != dt:
-                return None, 'All position arrays should be of the same type, you can e.g. provide dtype'
-        if pt != 'auto' and len(positions) != len(pt):
+        if validate and pt != 'auto' and len(positions) != len(pt):
             return None, 'For position type = {}, please provide a list of {:d} arrays for positions (found {:d})'.format(pt, len(pt), len(positions))
+        if isinstance(positions, np.ndarray):
+            dt = positions.dtype
+        elif not validate:
+            dt = positions[0].dtype
+        else:
+            positions = [np.asarray(p) for p in positions]
+            if len(set(p.shape for p in positions)) > 1:
+                return None, 'All position arrays should be of the same size'
+            dt = np.result_type(*positions)
+        # Cast to the input dtype if exists (else to the common type), as a single contiguous buffer
+        if dtype is not None: dt = np.dtype(dtype)
+        if validate and not np.issubdtype(dt, np.floating):
+            return None, 'Input position arrays should be of floating type, not {}'.format(dt)
+        positions = np.array(positions, dtype=dt, copy=True) if copy else np.ascontiguousarray(positions, dtype=dt)
+        if validate and positions.ndim != 2:
+            return None, 'Input position arrays should be 1D'
 
         if mode in ['theta', 'angular']:
             if pt == 'xyz':
@@ -205,7 +221,7 @@ def _format_positions(positions, mode='auto', position_type='xyz', dtype=None, c
     if mpiroot is None or (mpicomm.rank == mpiroot):
         if positions is not None and (position_type == 'pos' or not all(position is None for position in positions)):
             positions, error = __format_positions(positions)  # return error separately to raise on all processes
-    if mpicomm is not None:
+    if mpicomm is not None and validate:
         error = mpicomm.allgather(error)
     else:
         error = [error]
@@ -219,9 +235,10 @@ def _format_positions(positions, mode='auto', position_type='xyz', dtype=None, c
     return positions
 
 
-def _format_weights(weights, weight_type='auto', size=None, dtype=None, copy=True, mpicomm=None, mpiroot=None):
+def _format_weights(weights, weight_type='auto', size=None, dtype=None, copy=True, validate=True, mpicomm=None, mpiroot=None):
     # Format input weights, as a list of n_bitwise_weights uint8 arrays, and optionally a float array for individual weights.
     # Return formated list of weights, and n_bitwise_weights.
+    # If not validate, weights are assumed to be of the same size as positions and consistent across processes, and are not checked
 
     def __format_weights(weights):
         islist = isinstance(weights, (tuple, list)) or getattr(weights, 'ndim', 1) == 2
@@ -241,18 +258,22 @@ def _format_weights(weights, weight_type='auto', size=None, dtype=None, copy=Tru
         # any integer array bit size will be a multiple of 8
         bitwise_weights = utils.reformat_bitarrays(*bitwise_weights, dtype=np.uint8, copy=copy)
         n_bitwise_weights = len(bitwise_weights)
-        weights = bitwise_weights
+        # rows of a single contiguous (n_bitwise_weights, N) array; stack only arrays of the same size, others are caught by the size check below
+        if n_bitwise_weights > 1 and len(set(len(w) for w in bitwise_weights)) == 1:
+            weights = list(np.array(bitwise_weights, dtype=np.uint8))
+        else:
+            weights = [np.ascontiguousarray(w) for w in bitwise_weights]
         if individual_weights:
             if len(individual_weights) > 1 or copy:
                 weight = np.prod(individual_weights, axis=0, dtype=dtype)
             else:
-                weight = individual_weights[0].astype(dtype, copy=False)
+                weight = np.ascontiguousarray(individual_weights[0], dtype=dtype)
             weights += [weight]
         return weights, n_bitwise_weights
 
     weights, n_bitwise_weights = __format_weights(weights)
     if mpiroot is None:
-        if mpicomm is not None:
+        if mpicomm is not None and validate:
             size_weights = mpicomm.allgather(len(weights))
             if len(set(size_weights)) != 1:
                 raise ValueError('mpiroot = None but weights are None/empty on some ranks')
@@ -262,7 +283,7 @@ def _format_weights(weights, weight_type='auto', size=None, dtype=None, copy=Tru
         weights = [get_mpi().scatter(weight, mpicomm=mpicomm, mpiroot=mpiroot) for weight in weights]
         n_bitwise_weights = mpicomm.bcast(n_bitwise_weights, root=mpiroot)
 
-    if size is not None:
+    if size is not None and validate:
         if not all(len(weight) == size for weight in weights):
             raise ValueError('All weight arrays should be of the same size as position arrays')
     return weights, n_bitwise_weights
@@ -282,6 +303,9 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
         Two-point count normalization.
     """
     name = 'base'
+    # Whether to check input positions and weights; can be switched off (e.g. for an instance, before :meth:`__init__`)
+    # when these are known to be well-formatted, e.g. for the many counts of jackknife realizations
+    _validate = True
 
     def __init__(self, mode, edges, positions1, positions2=None, weights1=None, weights2=None,
                  bin_type='auto', position_type='auto', weight_type='auto', weight_attrs=None,
@@ -341,10 +365,9 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
             Then setting ``compute_sepsavg`` is virtually costless.
             For non-linear binning, set to "custom".
             "auto" allows for auto-detection of the binning type:
-            linear binning will be chosen if input edges are
-            within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
-            (absolute tolerance) of the array
-            ``np.linspace(edges[0], edges[-1], len(edges))``.
+            linear binning will be chosen if all bin widths ``np.diff(edges)``
+            are within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
+            (absolute tolerance) of the first one.
 
         position_type : string, default='auto'
             Type of input positions, one of:
@@ -419,7 +442,7 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
 
         dtype : string, np.dtype, default='f8'
             Array type for positions and weights.
-            If ``None``, defaults to type of first ``positions1`` array.
+            If ``None``, defaults to the common type of ``positions1`` arrays (e.g. float64 if float32 and float64 arrays are mixed).
             Double precision is highly recommended in case ``mode`` is "theta",
             ``twopoint_weights`` is provided (due to cosine), or ``compute_sepsavg`` is ``True``.
 
@@ -527,8 +550,7 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
         if self.bin_type not in allowed_bin_types:
             raise TwoPointCounterError('bin type should be one of {}'.format(allowed_bin_types))
         if self.bin_type == 'auto':
-            edges = self.edges[0]
-            if np.allclose(edges, np.linspace(edges[0], edges[-1], len(edges))):
+            if _is_linear(self.edges[0]):
                 self.bin_type = 'lin'
 
     @property
@@ -553,9 +575,9 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
         return self.mpicomm is not None and self.mpicomm.size > 1
 
     def _set_positions(self, positions1, positions2=None, position_type='auto', dtype=None, copy=False, mpiroot=None):
-        self.positions1 = _format_positions(positions1, mode=self.mode, position_type=position_type, dtype=dtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
+        self.positions1 = _format_positions(positions1, mode=self.mode, position_type=position_type, dtype=dtype, copy=copy, validate=self._validate, mpicomm=self.mpicomm, mpiroot=mpiroot)
         self.dtype = self.positions1[0].dtype
-        self.positions2 = _format_positions(positions2, mode=self.mode, position_type=position_type, dtype=self.dtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
+        self.positions2 = _format_positions(positions2, mode=self.mode, position_type=position_type, dtype=self.dtype, copy=copy, validate=self._validate, mpicomm=self.mpicomm, mpiroot=mpiroot)
         self.autocorr = self.positions2 is None
         if self.periodic:
             self.positions1 = [p % b.astype(p.dtype) for p, b in zip(self.positions1, self.boxsize)]
@@ -592,7 +614,7 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
             default_value = weight_attrs.get('default_value', 0.)
             self.weight_attrs.update(noffset=noffset, default_value=default_value)
 
-            self.weights1, n_bitwise_weights1 = _format_weights(weights1, weight_type=self.weight_type, size=self._size1, dtype=self.dtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
+            self.weights1, n_bitwise_weights1 = _format_weights(weights1, weight_type=self.weight_type, size=self._size1, dtype=self.dtype, copy=copy, validate=self._validate, mpicomm=self.mpicomm, mpiroot=mpiroot)
 
             def get_nrealizations(n_bitwise_weights):
                 nrealizations = weight_attrs.get('nrealizations', None)
@@ -600,7 +622,7 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
                     nrealizations = n_bitwise_weights * 8 + 1
                 return nrealizations
 
-            self.weights2, n_bitwise_weights2 = _format_weights(weights2, weight_type=self.weight_type, size=self._size2, dtype=self.dtype, copy=copy, mpicomm=self.mpicomm, mpiroot=mpiroot)
+            self.weights2, n_bitwise_weights2 = _format_weights(weights2, weight_type=self.weight_type, size=self._size2, dtype=self.dtype, copy=copy, validate=self._validate, mpicomm=self.mpicomm, mpiroot=mpiroot)
             self.same_shotnoise = self.autocorr and bool(self.weights2)
 
             if self.same_shotnoise:
@@ -706,7 +728,8 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
         return [(edges[1:] + edges[:-1]) / 2. for edges in self.edges]
 
     def _set_default_seps(self):
-        self.seps = list(np.meshgrid(*self._get_default_seps(), indexing='ij'))
+        # Read-only views of bin centers broadcast to :attr:`shape`, which take no memory; engines set new arrays when computing separations
+        self.seps = [np.broadcast_to(sep, self.shape) for sep in np.ix_(*self._get_default_seps())]
 
     def _set_los(self, los):
         self.los_type = los.lower()
@@ -889,7 +912,7 @@ class BaseTwoPointCounter(BaseClass, metaclass=RegisteredTwoPointCounter):
 
     @property
     def sep(self):
-        """Array of separation values of first dimension (e.g. :math:`s` if :attr:`mode` is "smu")."""
+        """Array of separation values of first dimension (e.g. :math:`s` if :attr:`mode` is "smu"); read-only if bin centers (not computed)."""
         return self.seps[0]
 
     @sep.setter
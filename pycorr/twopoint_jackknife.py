@@ -9,7 +9,7 @@ Implements methods to perform jackknife estimates of the correlation function co
 import numpy as np
 
 from .utils import BaseClass, get_mpi, TaskManager, _get_box, _make_array, _nan_to_zero
-from .twopoint_counter import BaseTwoPointCounter, TwoPointCounter, TwoPointCounterError, _format_positions
+from .twopoint_counter import BaseTwoPointCounter, TwoPointCounter, TwoPointCounterError, get_twopoint_counter, _format_positions
 from .twopoint_estimator import BaseTwoPointEstimator, TwoPointEstimatorError
 from . import utils
 
@@ -382,10 +382,9 @@ class JackknifeTwoPointCounter(BaseTwoPointCounter):
             Then setting ``compute_sepsavg`` is virtually costless.
             For non-linear binning, set to "custom".
             "auto" allows for auto-detection of the binning type:
-            linear binning will be chosen if input edges are
-            within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
-            (absolute tolerance) of the array
-            ``np.linspace(edges[0], edges[-1], len(edges))``.
+            linear binning will be chosen if all bin widths ``np.diff(edges)``
+            are within ``rtol = 1e-05`` (relative tolerance) *or* ``atol = 1e-08``
+            (absolute tolerance) of the first one.
 
         position_type : string, default='auto'
             Type of input positions, one of:
@@ -453,7 +452,7 @@ class JackknifeTwoPointCounter(BaseTwoPointCounter):
 
         dtype : string, np.dtype, default='f8'
             Array type for positions and weights.
-            If ``None``, defaults to type of first ``positions1`` array.
+            If ``None``, defaults to the common type of ``positions1`` arrays (e.g. float64 if float32 and float64 arrays are mixed).
             Double precision is highly recommended in case ``mode`` is "theta",
             ``twopoint_weights`` is provided (due to cosine), or ``compute_sepsavg`` is ``True``.
 
@@ -571,6 +570,14 @@ class JackknifeTwoPointCounter(BaseTwoPointCounter):
                     return [_gather_array(array) for array in arrays]
                 return arrays
 
+            def get_counter(*args, engine='corrfunc', **kwargs):
+                # Positions and weights have already been formatted by this instance, hence no need to validate them again
+                counter = get_twopoint_counter(engine)
+                new = counter.__new__(counter)
+                new._validate = False
+                new.__init__(*args, **kwargs)
+                return new
+
             positions2 = positions1 = _mpi_distribute_arrays(*self.positions1)
             weights2 = weights1 = _mpi_distribute_arrays(*self.weights1)
             samples2 = samples1 = _mpi_distribute_arrays(self.samples1)[0]
@@ -600,13 +607,13 @@ class JackknifeTwoPointCounter(BaseTwoPointCounter):
                 kwargs.update(self.attrs)
                 if self.same_shotnoise:
                     spositions2 = None
-                tmp = TwoPointCounter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
+                tmp = get_counter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
                 if is_root:
                     self.auto[ii] = tmp
                 if is_root:
                     spositions2 = [position[~mask2] for position in positions2]
                     sweights2 = [weight[~mask2] for weight in weights2]
-                tmp = TwoPointCounter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
+                tmp = get_counter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
                 if is_root:
                     self.cross12[ii] = tmp
                 if self.autocorr and tmp.is_reversible:
@@ -619,7 +626,7 @@ class JackknifeTwoPointCounter(BaseTwoPointCounter):
                         sweights1 = [weight[~mask1] for weight in weights1]
                         spositions2 = [position[mask2] for position in positions2]
                         sweights2 = [weight[mask2] for weight in weights2]
-                    tmp = TwoPointCounter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
+                    tmp = get_counter(self.mode, edges=self.edges, positions1=spositions1, weights1=sweights1, positions2=spositions2, weights2=sweights2, mpicomm=tm.mpicomm, mpiroot=mpiroot, **kwargs)
                     if is_root:
                         self.cross21[ii] = tmp
 
@@ -189,6 +189,33 @@ def distance(positions):
     return np.sqrt(sum(pos**2 for pos in positions))
 
 
+def empty_aligned(shape, dtype='f8', alignment=64):
+    """
+    Return empty C-contiguous array, whose data starts at a memory address multiple of ``alignment`` bytes
+    (64 bytes is the cache line size and the width of AVX-512 registers, while NumPy only guarantees 16-byte alignment).
+
+    Parameters
+    ----------
+    shape : int, tuple
+        Array shape.
+
+    dtype : string, np.dtype, default='f8'
+        Array type.
+
+    alignment : int, default=64
+        Alignment, in bytes.
+
+    Returns
+    -------
+    array : array
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape, dtype='i8')) * dtype.itemsize
+    buffer = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -buffer.ctypes.data % alignment
+    return buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
 def _make_array(value, shape, dtype='f8'):
     # Return numpy array filled with ``value``
     toret = np.empty(shape, dtype=dtype)
@@ -252,6 +279,8 @@ def cartesian_to_sky(positions, wrap=True, degree=True, dtype=None):
 def sky_to_cartesian(rdd, degree=True, dtype=None):
     """
     Transform RA, Dec, distance into cartesian coordinates.
+    If numba is already imported (e.g. by the numba engine), large (> 1000000) arrays
+    are transformed in a single, multithreaded pass.
 
     Parameters
     ----------
@@ -269,6 +298,17 @@ def sky_to_cartesian(rdd, degree=True, dtype=None):
     conversion = 1.
     if degree: conversion = np.pi / 180.
     ra, dec, dist = rdd
+    # numba is not imported here: its import and compilation time only pay off for large arrays
+    if 'numba' in sys.modules and max(np.size(xx) for xx in [ra, dec, dist]) > 1000000:
+        ra, dec, dist = (np.asarray(xx) for xx in [ra, dec, dist])
+        shape = np.broadcast_shapes(ra.shape, dec.shape, dist.shape)
+        if len(shape) == 1 and all(np.issubdtype(xx.dtype, np.floating) for xx in [ra, dec, dist]):
+            out = np.empty((3,) + shape, dtype=np.result_type(ra, dec, dist) if dtype is None else dtype)
+            # e.g. scalar distance: pass actual arrays to the compiled function
+            ra, dec, dist = (xx if xx.shape == shape else np.full(shape, xx, dtype=xx.dtype) for xx in [ra, dec, dist])
+            from .numba_engine import _sky_to_cartesian
+            _sky_to_cartesian(ra, dec, dist, conversion, out)
+            return list(out)
     cos_dec = np.cos(dec * conversion)
     x = dist * cos_dec * np.cos(ra * conversion)
     y = dist * cos_dec * np.sin(ra * conversion)
@@ -281,6 +321,8 @@ def rebin(array, new_shape, statistic=np.sum):
     Bin an array in all axes based on the target shape, by summing or
     averaging. Number of output dimensions must match number of input dimensions and
     new axes must divide old ones.
+    ``statistic`` is called once, with a tuple ``axis`` argument, and must reduce over all of these axes jointly
+    (as e.g. :func:`numpy.sum` and :func:`numpy.mean` do).
 
     Taken from https://stackoverflow.com/questions/8090229/resize-with-averaging-or-rebin-a-numpy-2d-array
     and https://nbodykit.readthedocs.io/en/latest/_modules/nbodykit/binned_statistic.html#BinnedStatistic.reindex.
@@ -311,11 +353,8 @@ def rebin(array, new_shape, statistic=np.sum):
 
     flattened = [ll for p in pairs for ll in p]
     array = array.reshape(flattened)
-
-    for i in range(len(new_shape)):
-        array = statistic(array, axis=-1 * (i + 1))
-
-    return array
+    # Reduce all sub-bin axes at once, in a single pass over the array
+    return statistic(array, axis=tuple(range(1, 2 * len(new_shape), 2)))
 
 
 # Create a lookup table for set bits per byte